@@ -13,6 +13,9 @@ class Settings(BaseSettings):
     ALGORITHM: str = "HS256"
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 30
     
+    # Password hashing (bcrypt cost factor; keep >= 10 in production)
+    BCRYPT_ROUNDS: int = 12
+    
     # Redis
     REDIS_URL: str = "redis://localhost:6379"
     
@@ -29,6 +32,8 @@ class Settings(BaseSettings):
     DEBUG: bool = False
     ENVIRONMENT: str = "development"
     ALLOWED_HOSTS: str = "localhost,127.0.0.1"
+    # Enable only behind a reverse proxy that sets X-Forwarded-For
+    TRUST_PROXY_HEADERS: bool = False
     
     class Config:
         env_file = ".env"
@@ -39,6 +44,13 @@ class Settings(BaseSettings):
         if len(v) < 32:
             raise ValueError('SECRET_KEY must be at least 32 characters')
         return v
+    
+    @validator('BCRYPT_ROUNDS')
+    def validate_bcrypt_rounds(cls, v):
+        """Ensure BCRYPT_ROUNDS is within bcrypt's supported range"""
+        if not 4 <= v <= 31:
+            raise ValueError('BCRYPT_ROUNDS must be between 4 and 31')
+        return v
 
 
 settings = Settings()
@@ -6,7 +6,8 @@ from .config import settings
 # Create engine
 engine = create_engine(
     settings.DATABASE_URL,
-    connect_args={"check_same_thread": False} if "sqlite" in settings.DATABASE_URL else {}
+    connect_args={"check_same_thread": False} if "sqlite" in settings.DATABASE_URL else {},
+    query_cache_size=1200  # Compiled statement cache for select() lookups
 )
 
 # Create session
@@ -1,10 +1,8 @@
 from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse
 from fastapi.middleware.trustedhost import TrustedHostMiddleware
-from slowapi import Limiter
-from slowapi.util import get_remote_address
 from slowapi.errors import RateLimitExceeded
-from slowapi import _rate_limit_exceeded_handler
 import time
 import logging
 
@@ -12,6 +10,7 @@ from .database import engine, Base
 from .models import user
 from .routers import auth, billing, signals
 from .config import settings
+from .utils.limiter import limiter
 
 # Configure logging
 logging.basicConfig(
@@ -23,38 +22,85 @@ logger = logging.getLogger(__name__)
 # Create database tables
 Base.metadata.create_all(bind=engine)
 
-# Rate limiter
-limiter = Limiter(key_func=get_remote_address)
-
 # Create FastAPI app
 app = FastAPI(
     title="Trading Signals SaaS API",
     description="FastAPI backend for stock trading signals with Stripe subscriptions",
     version="1.0.0",
     docs_url="/docs" if settings.DEBUG else None,
-    redoc_url="/redoc" if settings.DEBUG else None
+    redoc_url="/redoc" if settings.DEBUG else None,
+    default_response_class=ORJSONResponse
 )
 
+
+async def rate_limit_exceeded_handler(request: Request, exc: RateLimitExceeded):
+    """Return 429 with a `detail` message like other API errors, plus rate limit headers"""
+    if exc.limit.error_message:
+        detail = exc.detail
+    else:
+        detail = f"Rate limit exceeded: {exc.detail}"
+    response = ORJSONResponse({"detail": detail}, status_code=429)
+    return request.app.state.limiter._inject_headers(response, request.state.view_rate_limit)
+
+
 app.state.limiter = limiter
-app.add_exception_handler(RateLimitExceeded, _rate_limit_exceeded_handler)
-
-# Security headers middleware
-@app.middleware("http")
-async def add_security_headers(request: Request, call_next):
-    """Add security headers to all responses"""
-    response = await call_next(request)
-    
-    # Security headers
-    response.headers["X-Content-Type-Options"] = "nosniff"
-    response.headers["X-Frame-Options"] = "DENY"
-    response.headers["X-XSS-Protection"] = "1; mode=block"
-    response.headers["Referrer-Policy"] = "strict-origin-when-cross-origin"
-    
-    # HTTPS in production
-    if not settings.DEBUG:
-        response.headers["Strict-Transport-Security"] = "max-age=31536000; includeSubDomains"
-    
-    return response
+app.add_exception_handler(RateLimitExceeded, rate_limit_exceeded_handler)
+
+# Security headers, encoded once at import (HSTS only outside DEBUG)
+_PROD_HEADERS: list[tuple[bytes, bytes]] = [
+    (b"x-content-type-options", b"nosniff"),
+    (b"x-frame-options", b"DENY"),
+    (b"x-xss-protection", b"1; mode=block"),
+    (b"referrer-policy", b"strict-origin-when-cross-origin"),
+    (b"strict-transport-security", b"max-age=31536000; includeSubDomains"),
+]
+_DEV_HEADERS = _PROD_HEADERS[:-1]
+_HEADERS = _DEV_HEADERS if settings.DEBUG else _PROD_HEADERS
+
+
+class SecurityHeadersMiddleware:
+    """Pure ASGI middleware that adds security headers to all responses"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                # Copy rather than extend in place - the list may belong to a reused Response
+                headers = list(message.get("headers", ()))
+                headers.extend(_HEADERS)
+                message["headers"] = headers
+            await send(message)
+
+        await self.app(scope, receive, send_wrapper)
+
+
+app.add_middleware(SecurityHeadersMiddleware)
+
+
+class RealIPMiddleware:
+    """Pure ASGI middleware that sets the client address from X-Forwarded-For"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http":
+            for name, value in scope["headers"]:
+                if name == b"x-forwarded-for":
+                    # Last hop is the address our own proxy saw (earlier ones are client-supplied)
+                    real_ip = value.rsplit(b",", 1)[-1].strip()
+                    if real_ip:
+                        scope["client"] = (real_ip.decode("latin-1"), 0)
+                    break
+
+        await self.app(scope, receive, send)
+
 
 # CORS middleware
 app.add_middleware(
@@ -72,6 +118,10 @@ if not settings.DEBUG:
         allowed_hosts=settings.ALLOWED_HOSTS.split(",")
     )
 
+# Real client IP for rate limiting (only behind a trusted reverse proxy)
+if settings.TRUST_PROXY_HEADERS:
+    app.add_middleware(RealIPMiddleware)
+
 # Include routers
 app.include_router(auth.router)
 app.include_router(billing.router)
@@ -10,5 +10,5 @@ class User(Base):
     email = Column(String, unique=True, index=True, nullable=False)
     hashed_password = Column(String, nullable=False)
     is_paid = Column(Boolean, default=False, nullable=False)
-    stripe_customer_id = Column(String, nullable=True)
+    stripe_customer_id = Column(String, unique=True, index=True, nullable=True)
     created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
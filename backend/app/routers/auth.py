@@ -1,58 +1,63 @@
 from fastapi import APIRouter, Depends, HTTPException, status, Request
+from sqlalchemy import select
 from sqlalchemy.orm import Session
-from passlib.context import CryptContext
 from datetime import timedelta
+import bcrypt
+import hmac
+import time
 from ..database import get_db
 from ..models.user import User
 from ..schemas.user import UserCreate, UserLogin, UserResponse, Token
 from ..utils.jwt import create_access_token, get_current_user
-from ..utils.redis_client import get_redis
+from ..utils.limiter import limiter
 from ..config import settings
 
 router = APIRouter(prefix="/auth", tags=["Authentication"])
 
-# Password hashing
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# Short-lived cache of bcrypt verify results, keyed by HMAC(SECRET_KEY, password|hash)
+_verify_cache: dict[bytes, tuple[float, bool]] = {}
+VERIFY_CACHE_TTL = 60
+VERIFY_CACHE_MAX = 10_000
+
+# Bound once at import - fixed for the process lifetime
+_token_ttl = timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
 
 
 def hash_password(password: str) -> str:
     """Hash password using bcrypt"""
-    return pwd_context.hash(password)
+    return bcrypt.hashpw(password.encode(), bcrypt.gensalt(rounds=settings.BCRYPT_ROUNDS)).decode()
 
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
-    """Verify password against hash"""
-    return pwd_context.verify(plain_password, hashed_password)
-
-
-def check_rate_limit(redis_client, key: str, limit: int = 10, window: int = 60) -> bool:
-    """Check rate limit using Redis. Returns True if under limit."""
-    current = redis_client.get(key)
-    if current is None:
-        redis_client.setex(key, window, 1)
-        return True
-    elif int(current) < limit:
-        redis_client.incr(key)
-        return True
-    return False
+    """Verify password against hash, reusing recent results to skip bcrypt"""
+    key = hmac.new(
+        settings.SECRET_KEY.encode(),
+        plain_password.encode() + b"|" + hashed_password.encode(),
+        "sha256"
+    ).digest()
+    now = time.monotonic()
+    
+    cached = _verify_cache.get(key)
+    if cached is not None:
+        if now - cached[0] < VERIFY_CACHE_TTL:
+            return cached[1]
+        _verify_cache.pop(key, None)
+    
+    result = bcrypt.checkpw(plain_password.encode(), hashed_password.encode())
+    _verify_cache[key] = (now, result)
+    
+    # Evict oldest entries (dicts keep insertion order)
+    while len(_verify_cache) > VERIFY_CACHE_MAX:
+        del _verify_cache[next(iter(_verify_cache))]
+    return result
 
 
 @router.post("/signup", response_model=Token, status_code=status.HTTP_201_CREATED)
+@limiter.limit("10/minute", error_message="Too many signup attempts. Please try again later.")
 async def signup(user_data: UserCreate, request: Request, db: Session = Depends(get_db)):
     """Register new user with rate limiting"""
-    redis_client = get_redis()
-    
-    # Rate limiting: 10 requests per minute per IP
-    client_ip = request.client.host if request.client else "test_client"
-    rate_key = f"rate_limit:signup:{client_ip}"
-    if not check_rate_limit(redis_client, rate_key, limit=10, window=60):
-        raise HTTPException(
-            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
-            detail="Too many signup attempts. Please try again later."
-        )
-    
     # Check if user already exists
-    existing_user = db.query(User).filter(User.email == user_data.email).first()
+    existing_user = db.execute(select(User).where(User.email == user_data.email)).scalar_one_or_none()
     if existing_user:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
@@ -72,28 +77,18 @@ async def signup(user_data: UserCreate, request: Request, db: Session = Depends(
     # Create access token
     access_token = create_access_token(
         data={"sub": new_user.email},
-        expires_delta=timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
+        expires_delta=_token_ttl
     )
     
     return {"access_token": access_token, "token_type": "bearer"}
 
 
 @router.post("/login", response_model=Token)
+@limiter.limit("10/minute", error_message="Too many login attempts. Please try again later.")
 async def login(user_data: UserLogin, request: Request, db: Session = Depends(get_db)):
     """Login user with rate limiting"""
-    redis_client = get_redis()
-    
-    # Rate limiting: 10 requests per minute per IP
-    client_ip = request.client.host if request.client else "test_client"
-    rate_key = f"rate_limit:login:{client_ip}"
-    if not check_rate_limit(redis_client, rate_key, limit=10, window=60):
-        raise HTTPException(
-            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
-            detail="Too many login attempts. Please try again later."
-        )
-    
     # Find user
-    user = db.query(User).filter(User.email == user_data.email).first()
+    user = db.execute(select(User).where(User.email == user_data.email)).scalar_one_or_none()
     if not user or not verify_password(user_data.password, user.hashed_password):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -103,7 +98,7 @@ async def login(user_data: UserLogin, request: Request, db: Session = Depends(ge
     # Create access token
     access_token = create_access_token(
         data={"sub": user.email},
-        expires_delta=timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
+        expires_delta=_token_ttl
     )
     
     return {"access_token": access_token, "token_type": "bearer"}
@@ -1,6 +1,14 @@
 from fastapi import APIRouter, Depends, HTTPException, status, Request
+from fastapi.responses import RedirectResponse
+from collections import OrderedDict
+from sqlalchemy import update
 from sqlalchemy.orm import Session
+from stripe.error import SignatureVerificationError
+import hashlib
+import hmac
+import orjson
 import stripe
+import time
 from ..database import get_db
 from ..models.user import User
 from ..schemas.billing import CheckoutSessionCreate, SubscriptionStatus
@@ -11,32 +19,112 @@ from ..config import settings
 
 router = APIRouter(prefix="/billing", tags=["Billing"])
 
+_redis = get_redis()
+
+# Recently processed webhook event IDs - skips the Redis round trip on Stripe retries
+RECENT_EVENTS_MAX = 1024
+_recent_events: OrderedDict = OrderedDict()
+
+# Webhook signing key schedule computed once; copied per request
+_HMAC_TEMPLATE = hmac.new(settings.STRIPE_WEBHOOK_SECRET.encode(), digestmod=hashlib.sha256)
+WEBHOOK_TOLERANCE = 300  # Max signature age in seconds (Stripe's default)
+
+# Default Checkout redirect URLs
+DEFAULT_SUCCESS_URL = f"{settings.FRONTEND_URL}/dashboard?success=true&session_id={{CHECKOUT_SESSION_ID}}"
+DEFAULT_CANCEL_URL = f"{settings.FRONTEND_URL}/dashboard?canceled=true"
+
+
+def verify_signature(payload: bytes, sig_header: str, tolerance: int = WEBHOOK_TOLERANCE) -> None:
+    """Verify Stripe-Signature header (t=...,v1=...) with a constant-time compare"""
+    try:
+        pairs = [item.split("=", 1) for item in sig_header.split(",")]
+        timestamp = int(next(value for key, value in pairs if key == "t"))
+        signatures = [value.encode("latin-1") for key, value in pairs if key == "v1"]
+    except (AttributeError, ValueError, StopIteration):
+        raise SignatureVerificationError(
+            "Unable to extract timestamp and signatures from header", sig_header, payload
+        )
+    
+    mac = _HMAC_TEMPLATE.copy()
+    mac.update(f"{timestamp}.".encode())
+    mac.update(payload)
+    expected = mac.hexdigest().encode()
+    
+    if not any(hmac.compare_digest(expected, signature) for signature in signatures):
+        raise SignatureVerificationError(
+            "No signatures found matching the expected signature for payload", sig_header, payload
+        )
+    if timestamp < time.time() - tolerance:
+        raise SignatureVerificationError("Timestamp outside the tolerance zone", sig_header, payload)
+
+
+def construct_event(payload: bytes, sig_header: str):
+    """Verify webhook signature and parse the Stripe event (ValueError on bad JSON)"""
+    verify_signature(payload, sig_header)
+    return stripe.Event.construct_from(orjson.loads(payload), settings.STRIPE_SECRET_KEY)
+
+
+def set_paid_status(db: Session, customer_id: str, is_paid: bool) -> None:
+    """Update subscription status by Stripe customer ID in a single UPDATE"""
+    # A missing ID would compile to "IS NULL" and match every non-Stripe user
+    if not customer_id:
+        return
+    
+    db.execute(
+        update(User)
+        .where(User.stripe_customer_id == customer_id)
+        .values(is_paid=is_paid)
+    )
+    db.commit()
+
+
+def remember_event(event_id: str) -> None:
+    """Record event ID in the in-process LRU of processed events"""
+    _recent_events[event_id] = True
+    _recent_events.move_to_end(event_id)
+    if len(_recent_events) > RECENT_EVENTS_MAX:
+        _recent_events.popitem(last=False)
+
+
+def link_customer(db: Session, user_id: str, customer_id: str) -> None:
+    """Store the Stripe customer created by Checkout on a user without one (not committed)"""
+    # Sessions created outside this app (Payment Links, dashboard) may carry any reference
+    if not (user_id and customer_id and user_id.isdigit()):
+        return
+    
+    db.execute(
+        update(User)
+        .where(User.id == int(user_id), User.stripe_customer_id.is_(None))
+        .values(stripe_customer_id=customer_id)
+    )
+
 
 @router.post("/create-checkout")
 async def create_checkout_session(
     checkout_data: CheckoutSessionCreate,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    redirect: bool = False,
+    current_user: User = Depends(get_current_user)
 ):
-    """Create Stripe Checkout session for ₹499 subscription"""
+    """
+    Create Stripe Checkout session for ₹499 subscription.
+    - Default: JSON with checkout_url (for the SPA to navigate to)
+    - ?redirect=true: 303 redirect straight to Stripe (server-rendered flows)
+    """
     try:
-        # Create or retrieve Stripe customer
-        if not current_user.stripe_customer_id:
-            customer = stripe.Customer.create(
-                email=current_user.email,
-                metadata={"user_id": str(current_user.id)}
-            )
-            current_user.stripe_customer_id = customer.id
-            db.commit()
+        # Reuse existing Stripe customer, otherwise Checkout creates one from the
+        # email and the webhook links it (saves a blocking Customer.create call)
+        if current_user.stripe_customer_id:
+            customer_args = {"customer": current_user.stripe_customer_id}
         else:
-            customer_id = current_user.stripe_customer_id
+            customer_args = {"customer_email": current_user.email}
         
         # Create checkout session
-        success_url = checkout_data.success_url or f"{settings.FRONTEND_URL}/dashboard?success=true&session_id={{CHECKOUT_SESSION_ID}}"
-        cancel_url = checkout_data.cancel_url or f"{settings.FRONTEND_URL}/dashboard?canceled=true"
+        success_url = checkout_data.success_url or DEFAULT_SUCCESS_URL
+        cancel_url = checkout_data.cancel_url or DEFAULT_CANCEL_URL
         
         checkout_session = stripe.checkout.Session.create(
-            customer=current_user.stripe_customer_id,
+            **customer_args,
+            client_reference_id=str(current_user.id),
             payment_method_types=["card"],
             line_items=[
                 {
@@ -53,6 +141,9 @@ async def create_checkout_session(
             }
         )
         
+        if redirect:
+            return RedirectResponse(checkout_session.url, status_code=status.HTTP_303_SEE_OTHER)
+        
         return {
             "checkout_url": checkout_session.url,
             "session_id": checkout_session.id
@@ -82,56 +173,56 @@ async def stripe_webhook(request: Request, db: Session = Depends(get_db)):
     
     try:
         # Verify webhook signature
-        event = stripe.Webhook.construct_event(
-            payload, sig_header, settings.STRIPE_WEBHOOK_SECRET
-        )
+        event = construct_event(payload, sig_header)
     except ValueError:
         raise HTTPException(status_code=400, detail="Invalid payload")
-    except stripe.error.SignatureVerificationError:
+    except SignatureVerificationError:
         raise HTTPException(status_code=400, detail="Invalid signature")
     
-    redis_client = get_redis()
     event_id = event["id"]
     
-    # Redis idempotency check (24h TTL)
-    redis_key = f"stripe_event:{event_id}"
-    if redis_client.get(redis_key):
+    # Fast path: event already seen by this process
+    if event_id in _recent_events:
         return {"status": "already_processed"}
     
-    # Mark event as processed
-    redis_client.setex(redis_key, 86400, "1")
-    
-    # Handle different event types
-    event_type = event["type"]
+    # Redis idempotency check (24h TTL) - atomically claim the event
+    redis_key = f"stripe_event:{event_id}"
+    claimed = await _redis.set(redis_key, "1", nx=True, ex=86400)
+    if not claimed:
+        return {"status": "already_processed"}
     
-    if event_type == "checkout.session.completed":
-        session = event["data"]["object"]
-        customer_id = session.get("customer")
+    try:
+        # Handle different event types
+        event_type = event["type"]
         
-        # Find user by Stripe customer ID
-        user = db.query(User).filter(User.stripe_customer_id == customer_id).first()
-        if user:
-            user.is_paid = True
-            db.commit()
-    
-    elif event_type == "invoice.payment_succeeded":
-        invoice = event["data"]["object"]
-        customer_id = invoice.get("customer")
+        if event_type == "checkout.session.completed":
+            session = event["data"]["object"]
+            customer_id = session.get("customer")
+            user_id = session.get("client_reference_id")
+            
+            # Link customer created during Checkout (committed with the paid status)
+            link_customer(db, user_id, customer_id)
+            
+            # Mark user as paid by Stripe customer ID
+            set_paid_status(db, customer_id, True)
         
-        # Extend subscription
-        user = db.query(User).filter(User.stripe_customer_id == customer_id).first()
-        if user:
-            user.is_paid = True
-            db.commit()
-    
-    elif event_type == "customer.subscription.deleted":
-        subscription = event["data"]["object"]
-        customer_id = subscription.get("customer")
+        elif event_type == "invoice.payment_succeeded":
+            invoice = event["data"]["object"]
+            customer_id = invoice.get("customer")
+            
+            # Extend subscription
+            set_paid_status(db, customer_id, True)
         
-        # Downgrade to free
-        user = db.query(User).filter(User.stripe_customer_id == customer_id).first()
-        if user:
-            user.is_paid = False
-            db.commit()
+        elif event_type == "customer.subscription.deleted":
+            subscription = event["data"]["object"]
+            customer_id = subscription.get("customer")
+            
+            # Downgrade to free
+            set_paid_status(db, customer_id, False)
+    except Exception:
+        # Release the claim so Stripe's retry can process the event
+        await _redis.delete(redis_key)
+        raise
     
+    remember_event(event_id)
     return {"status": "success", "event_type": event_type}
@@ -1,32 +1,74 @@
 from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi.responses import Response
 from datetime import datetime, date
-import json
+import orjson
 import random
 from ..models.user import User
 from ..schemas.signal import SignalsResponse, Signal
 from ..utils.jwt import get_current_user
-from ..utils.redis_client import get_redis
+from ..utils.redis_client import get_redis, INCR_EXPIRE_SCRIPT
 
 router = APIRouter(prefix="/signals", tags=["Signals"])
 
+_redis = get_redis()
+
+# Daily counter script (INCR + EXPIRE in one round trip)
+_LIMIT_SCRIPT = _redis.register_script(INCR_EXPIRE_SCRIPT)
+
+FREE_SIGNAL_LIMIT = 3
+FREE_USER_LIMIT = "3/day (upgrade for unlimited)"
+
+# Encoded response bodies per day: today -> (cached Redis value, paid body, free body)
+_local_cache: dict[str, tuple[str, bytes, bytes]] = {}
+
+
+# Mock price model per symbol: (base price, max deviation)
+MOCK_SYMBOLS = {"NIFTY": (21500, 500), "BANKNIFTY": (45000, 1000)}
+SIGNAL_TYPES = ["BUY", "SELL", "HOLD"]
+SIGNALS_PER_SYMBOL = 5
+
 
 def generate_mock_signals() -> list:
     """Generate mock trading signals for NIFTY/BANKNIFTY"""
-    symbols = ["NIFTY", "BANKNIFTY"]
-    signal_types = ["BUY", "SELL", "HOLD"]
+    uniform = random.uniform
+    timestamp = datetime.utcnow().isoformat()
+    types = iter(random.choices(SIGNAL_TYPES, k=SIGNALS_PER_SYMBOL * len(MOCK_SYMBOLS)))
+    
+    return [
+        {
+            "symbol": symbol,
+            "type": next(types),
+            "price": round(base + uniform(-spread, spread), 2),
+            "confidence": round(uniform(0.6, 0.95), 2),
+            "timestamp": timestamp
+        }
+        for symbol, (base, spread) in MOCK_SYMBOLS.items()
+        for _ in range(SIGNALS_PER_SYMBOL)
+    ]
+
+
+def get_response_bodies(today: str, cached_signals: str) -> tuple[bytes, bytes]:
+    """Return (paid, free) JSON bodies, re-encoding only when the Redis value changes"""
+    entry = _local_cache.get(today)
+    if entry is not None and entry[0] == cached_signals:
+        return entry[1], entry[2]
     
-    signals = []
-    for symbol in symbols:
-        for i in range(5):  # Generate 5 signals per symbol
-            signals.append({
-                "symbol": symbol,
-                "type": random.choice(signal_types),
-                "price": round(21500 + random.uniform(-500, 500), 2) if symbol == "NIFTY" else round(45000 + random.uniform(-1000, 1000), 2),
-                "confidence": round(random.uniform(0.6, 0.95), 2),
-                "timestamp": datetime.utcnow().isoformat()
-            })
+    signals_data = orjson.loads(cached_signals)
+    paid_body = orjson.dumps({
+        "signals": signals_data,
+        "user_limit": None,
+        "is_paid": True
+    })
+    free_body = orjson.dumps({
+        "signals": signals_data[:FREE_SIGNAL_LIMIT],
+        "user_limit": FREE_USER_LIMIT,
+        "is_paid": False
+    })
     
-    return signals
+    # Only keep the current day
+    _local_cache.clear()
+    _local_cache[today] = (cached_signals, paid_body, free_body)
+    return paid_body, free_body
 
 
 @router.get("", response_model=SignalsResponse)
@@ -36,47 +78,30 @@ async def get_signals(current_user: User = Depends(get_current_user)):
     - Free users: 3 signals/day
     - Paid users: Unlimited signals
     """
-    redis_client = get_redis()
     today = date.today().isoformat()
     
     # Check rate limit for free users
     if not current_user.is_paid:
         rate_key = f"signal_limit:{current_user.id}:{today}"
-        count = redis_client.get(rate_key)
+        count = await _LIMIT_SCRIPT(keys=[rate_key], args=[86400], client=_redis)  # 24h TTL
         
-        if count and int(count) >= 3:
+        if int(count) > FREE_SIGNAL_LIMIT:
             raise HTTPException(
                 status_code=status.HTTP_403_FORBIDDEN,
                 detail="Daily limit exceeded. Upgrade to paid plan for unlimited signals."
             )
-        
-        # Increment counter
-        if count is None:
-            redis_client.setex(rate_key, 86400, 1)  # 24h TTL
-        else:
-            redis_client.incr(rate_key)
     
     # Check Redis cache for signals (TTL 300 sec = 5 min)
     cache_key = f"signals:all:{today}"
-    cached_signals = redis_client.get(cache_key)
+    cached_signals = await _redis.get(cache_key)
     
-    if cached_signals:
-        signals_data = json.loads(cached_signals)
-    else:
+    if not cached_signals:
         # Generate mock signals (simulating expensive computation)
-        signals_data = generate_mock_signals()
+        cached_signals = orjson.dumps(generate_mock_signals()).decode()
         # Cache in Redis
-        redis_client.setex(cache_key, 300, json.dumps(signals_data))
+        await _redis.setex(cache_key, 300, cached_signals)
     
-    # Limit signals for free users
-    if not current_user.is_paid:
-        signals_data = signals_data[:3]  # Only first 3 signals
-        user_limit = "3/day (upgrade for unlimited)"
-    else:
-        user_limit = None
-    
-    return {
-        "signals": signals_data,
-        "user_limit": user_limit,
-        "is_paid": current_user.is_paid
-    }
+    # Serve pre-encoded JSON (free users get only the first 3 signals)
+    paid_body, free_body = get_response_bodies(today, cached_signals)
+    body = paid_body if current_user.is_paid else free_body
+    return Response(content=body, media_type="application/json")
@@ -3,6 +3,7 @@ from typing import Optional
 from jose import JWTError, jwt
 from fastapi import Depends, HTTPException, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
+from sqlalchemy import select
 from sqlalchemy.orm import Session
 from ..config import settings
 from ..database import get_db
@@ -50,7 +51,7 @@ def get_current_user(
             detail="Could not validate credentials"
         )
     
-    user = db.query(User).filter(User.email == email).first()
+    user = db.execute(select(User).where(User.email == email)).scalar_one_or_none()
     if user is None:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -0,0 +1,6 @@
+from slowapi import Limiter
+from slowapi.util import get_remote_address
+
+# Rate limiter (in-process memory storage; slowapi's Redis storage is synchronous
+# and would block the event loop on every rate-limited request)
+limiter = Limiter(key_func=get_remote_address)
@@ -1,68 +1,118 @@
+import heapq
+import threading
+import time
 import redis
+import redis.asyncio as aioredis
 from ..config import settings
 from typing import Optional
 
+# Atomic counter: INCR and set the TTL on first hit, in a single round trip
+INCR_EXPIRE_SCRIPT = (
+    "local c = redis.call('INCR', KEYS[1]) "
+    "if c == 1 then redis.call('EXPIRE', KEYS[1], ARGV[1]) end "
+    "return c"
+)
+
 # Try to connect to Redis, fall back to mock if not available
 try:
-    redis_client = redis.from_url(settings.REDIS_URL, decode_responses=True, socket_connect_timeout=2)
-    redis_client.ping()  # Test connection
+    # Test connection synchronously (no event loop at import), then serve via asyncio client
+    _probe = redis.from_url(settings.REDIS_URL, socket_connect_timeout=2)
+    _probe.ping()
+    _probe.close()
+    redis_client = aioredis.from_url(settings.REDIS_URL, decode_responses=True, socket_connect_timeout=2)
     REDIS_AVAILABLE = True
 except (redis.ConnectionError, redis.TimeoutError, Exception):
     REDIS_AVAILABLE = False
     
     # Mock Redis for local development without running server
     class MockRedis:
-        """Simple in-memory mock Redis for development"""
+        """Simple in-memory async mock Redis for development (thread-safe, lazy expiry)"""
         def __init__(self):
             self.data = {}
-            self.expiry = {}
+            self._exp_map: dict[str, float] = {}
+            self._exp_heap: list[tuple[float, str]] = []
+            self._lock = threading.RLock()
+        
+        def _expire_due(self, now: float) -> None:
+            """Drop every key whose expiry has passed (caller holds the lock)"""
+            heap = self._exp_heap
+            while heap and heap[0][0] <= now:
+                ts, key = heapq.heappop(heap)
+                # Skip stale heap entries left behind by a later set/expire
+                if self._exp_map.get(key) == ts:
+                    del self._exp_map[key]
+                    self.data.pop(key, None)
+        
+        def _set_expiry(self, key: str, ex: int) -> None:
+            """Schedule key expiry (caller holds the lock)"""
+            ts = time.monotonic() + ex
+            self._exp_map[key] = ts
+            heapq.heappush(self._exp_heap, (ts, key))
         
-        def get(self, key: str) -> Optional[str]:
+        async def get(self, key: str) -> Optional[str]:
             """Get value by key"""
-            import time
-            if key in self.expiry:
-                if time.time() > self.expiry[key]:
-                    del self.data[key]
-                    del self.expiry[key]
-                    return None
-            return self.data.get(key)
+            with self._lock:
+                self._expire_due(time.monotonic())
+                return self.data.get(key)
         
-        def set(self, key: str, value: str) -> None:
-            """Set value"""
-            self.data[key] = value
+        async def set(self, key: str, value: str, ex: Optional[int] = None, nx: bool = False) -> Optional[bool]:
+            """Set value (nx: only if missing, ex: expiry in seconds)"""
+            with self._lock:
+                self._expire_due(time.monotonic())
+                if nx and key in self.data:
+                    return None
+                self.data[key] = value
+                if ex is not None:
+                    self._set_expiry(key, ex)
+                else:
+                    self._exp_map.pop(key, None)
+                return True
         
-        def setex(self, key: str, ex: int, value: str) -> None:
+        async def setex(self, key: str, ex: int, value: str) -> None:
             """Set value with expiry"""
-            import time
-            self.data[key] = value
-            self.expiry[key] = time.time() + ex
+            with self._lock:
+                self._expire_due(time.monotonic())
+                self.data[key] = value
+                self._set_expiry(key, ex)
         
-        def incr(self, key: str) -> int:
+        async def incr(self, key: str) -> int:
             """Increment counter"""
-            import time
-            # Remove if expired
-            if key in self.expiry and time.time() > self.expiry[key]:
-                del self.data[key]
-                del self.expiry[key]
-            
-            if key not in self.data:
-                self.data[key] = 1
-            else:
-                self.data[key] = int(self.data[key]) + 1
-            return self.data[key]
+            with self._lock:
+                self._expire_due(time.monotonic())
+                self.data[key] = int(self.data.get(key, 0)) + 1
+                return self.data[key]
         
-        def expire(self, key: str, ex: int) -> None:
+        async def expire(self, key: str, ex: int) -> None:
             """Set expiry for key"""
-            import time
-            if key in self.data:
-                self.expiry[key] = time.time() + ex
+            with self._lock:
+                self._expire_due(time.monotonic())
+                if key in self.data:
+                    self._set_expiry(key, ex)
         
-        def delete(self, key: str) -> None:
+        async def delete(self, key: str) -> None:
             """Delete key"""
-            self.data.pop(key, None)
-            self.expiry.pop(key, None)
+            with self._lock:
+                self.data.pop(key, None)
+                self._exp_map.pop(key, None)
+        
+        def register_script(self, script: str):
+            """Register Lua script (only INCR_EXPIRE_SCRIPT is emulated)"""
+            if script != INCR_EXPIRE_SCRIPT:
+                raise NotImplementedError("MockRedis only supports INCR_EXPIRE_SCRIPT")
+            
+            async def incr_expire(keys=(), args=(), client=None) -> int:
+                key = keys[0]
+                with self._lock:
+                    self._expire_due(time.monotonic())
+                    count = int(self.data.get(key, 0)) + 1
+                    self.data[key] = count
+                    if count == 1:
+                        self._set_expiry(key, int(args[0]))
+                    return count
+            
+            return incr_expire
         
-        def ping(self) -> str:
+        async def ping(self) -> str:
             """Health check"""
             return "PONG"
     
@@ -70,5 +120,5 @@ except (redis.ConnectionError, redis.TimeoutError, Exception):
 
 
 def get_redis():
-    """Get Redis client (real or mock)"""
+    """Get async Redis client (real or mock)"""
     return redis_client
@@ -1,33 +1,102 @@
+import os
 import pytest
-from fastapi.testclient import TestClient
-from sqlalchemy import create_engine
+import pytest_asyncio
+from httpx import AsyncClient, ASGITransport
+from types import SimpleNamespace
+from unittest.mock import patch
+from sqlalchemy import create_engine, event
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+from datetime import timedelta
+
+# Minimum bcrypt cost for fast test fixtures and an in-memory app database, so
+# importing app.main does not create trading_signals.db (must be set before app import)
+os.environ.setdefault("BCRYPT_ROUNDS", "4")
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+
 from app.main import app
 from app.database import Base, get_db
 from app.models.user import User
 from app.utils.jwt import create_access_token
 
-# Test database
-SQLALCHEMY_DATABASE_URL = "sqlite:///./test.db"
-engine = create_engine(SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False})
-TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+# Test database (in-memory, single shared connection)
+SQLALCHEMY_DATABASE_URL = "sqlite://"
 
+# Test principals (tokens carry only the email, so they can outlive the user rows)
+TEST_USER_EMAIL = "test@example.com"
+PAID_USER_EMAIL = "paid@example.com"
+TOKEN_TTL = timedelta(days=1)
 
-@pytest.fixture
-def db_session():
-    """Create test database"""
+
+@pytest.fixture(scope="session")
+def engine():
+    """Create test engine and schema once per session (per worker under pytest -n)"""
+    engine = create_engine(
+        SQLALCHEMY_DATABASE_URL,
+        connect_args={"check_same_thread": False},
+        poolclass=StaticPool
+    )
+    
+    # Let SQLAlchemy emit BEGIN itself so SAVEPOINTs work with pysqlite
+    @event.listens_for(engine, "connect")
+    def do_connect(dbapi_connection, connection_record):
+        dbapi_connection.isolation_level = None
+    
+    @event.listens_for(engine, "begin")
+    def do_begin(conn):
+        conn.exec_driver_sql("BEGIN")
+    
     Base.metadata.create_all(bind=engine)
-    db = TestingSessionLocal()
+    yield engine
+    engine.dispose()
+
+
+@pytest.fixture(scope="session", autouse=True)
+def stripe_mocks():
+    """Patch Stripe API calls once for the whole test session"""
+    from app.routers import billing
+    real_construct = billing.construct_event
+    with patch.object(billing.stripe.Customer, "create") as customer, \
+         patch.object(billing.stripe.checkout.Session, "create") as session, \
+         patch.object(billing, "construct_event") as construct:
+        yield SimpleNamespace(
+            customer=customer,
+            session=session,
+            construct=construct,
+            real_construct=real_construct  # Unpatched signature verification
+        )
+
+
+@pytest.fixture(autouse=True)
+def reset_stripe_mocks(stripe_mocks):
+    """Clear Stripe mock calls, return values and side effects before each test"""
+    for mock in (stripe_mocks.customer, stripe_mocks.session, stripe_mocks.construct):
+        mock.reset_mock(return_value=True, side_effect=True)
+
+
+@pytest.fixture
+def db_session(engine):
+    """Create test database session inside a transaction rolled back afterwards"""
+    connection = engine.connect()
+    transaction = connection.begin()
+    # Session commits only release SAVEPOINTs; the outer transaction is never committed
+    db = sessionmaker(
+        bind=connection,
+        autocommit=False,
+        autoflush=False,
+        join_transaction_mode="create_savepoint"
+    )()
     try:
         yield db
     finally:
         db.close()
-        Base.metadata.drop_all(bind=engine)
+        transaction.rollback()
+        connection.close()
 
 
-@pytest.fixture
-def client(db_session):
-    """Create test client"""
+@pytest_asyncio.fixture
+async def client(db_session):
+    """Create async test client (requests run in-loop through the ASGI app)"""
     def override_get_db():
         try:
             yield db_session
@@ -35,7 +104,8 @@ def client(db_session):
             pass
     
     app.dependency_overrides[get_db] = override_get_db
-    yield TestClient(app)
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as c:
+        yield c
     app.dependency_overrides.clear()
 
 
@@ -44,7 +114,7 @@ def test_user(db_session):
     """Create test user"""
     from app.routers.auth import hash_password
     user = User(
-        email="test@example.com",
+        email=TEST_USER_EMAIL,
         hashed_password=hash_password("testpass123"),
         is_paid=False
     )
@@ -59,7 +129,7 @@ def test_paid_user(db_session):
     """Create test paid user"""
     from app.routers.auth import hash_password
     user = User(
-        email="paid@example.com",
+        email=PAID_USER_EMAIL,
         hashed_password=hash_password("testpass123"),
         is_paid=True
     )
@@ -69,13 +139,37 @@ def test_paid_user(db_session):
     return user
 
 
+@pytest.fixture(scope="session")
+def session_auth_token():
+    """Sign JWT for test user once per session"""
+    return create_access_token(data={"sub": TEST_USER_EMAIL}, expires_delta=TOKEN_TTL)
+
+
+@pytest.fixture(scope="session")
+def session_paid_auth_token():
+    """Sign JWT for paid test user once per session"""
+    return create_access_token(data={"sub": PAID_USER_EMAIL}, expires_delta=TOKEN_TTL)
+
+
+@pytest.fixture
+def auth_token(test_user, session_auth_token):
+    """JWT token for test user (user row recreated per test)"""
+    return session_auth_token
+
+
+@pytest.fixture
+def paid_auth_token(test_paid_user, session_paid_auth_token):
+    """JWT token for paid test user (user row recreated per test)"""
+    return session_paid_auth_token
+
+
 @pytest.fixture
-def auth_token(test_user):
-    """Create JWT token for test user"""
-    return create_access_token(data={"sub": test_user.email})
+def auth_header(auth_token):
+    """Authorization header for test user"""
+    return {"Authorization": f"Bearer {auth_token}"}
 
 
 @pytest.fixture
-def paid_auth_token(test_paid_user):
-    """Create JWT token for paid test user"""
-    return create_access_token(data={"sub": test_paid_user.email})
+def paid_auth_header(paid_auth_token):
+    """Authorization header for paid test user"""
+    return {"Authorization": f"Bearer {paid_auth_token}"}
@@ -1,4 +1,8 @@
-def test_signup_login(client):
+import pytest
+
+
+@pytest.mark.asyncio
+async def test_signup_login(client):
     """Test user signup and login - verify JWT returned"""
     
     # Test signup
@@ -6,7 +10,7 @@ def test_signup_login(client):
         "email": "newuser@example.com",
         "password": "password123"
     }
-    response = client.post("/auth/signup", json=signup_data)
+    response = await client.post("/auth/signup", json=signup_data)
     assert response.status_code == 201
     assert "access_token" in response.json()
     assert response.json()["token_type"] == "bearer"
@@ -16,34 +20,72 @@ def test_signup_login(client):
         "email": "newuser@example.com",
         "password": "password123"
     }
-    response = client.post("/auth/login", json=login_data)
+    response = await client.post("/auth/login", json=login_data)
     assert response.status_code == 200
     assert "access_token" in response.json()
     assert response.json()["token_type"] == "bearer"
 
 
-def test_auth_protected_route(client, test_user):
+@pytest.mark.asyncio
+async def test_auth_protected_route(client, test_user):
     """Test that protected routes return 401 without JWT"""
     
     # Try to access /auth/me without token
-    response = client.get("/auth/me")
+    response = await client.get("/auth/me")
     assert response.status_code == 403  # Missing authorization header
     
     # Try with invalid token
-    response = client.get(
+    response = await client.get(
         "/auth/me",
         headers={"Authorization": "Bearer invalid_token"}
     )
     assert response.status_code == 401
 
 
-def test_auth_me_with_valid_token(client, auth_token, test_user):
+@pytest.mark.asyncio
+async def test_auth_me_with_valid_token(client, auth_header, test_user):
     """Test /auth/me endpoint with valid token"""
-    response = client.get(
+    response = await client.get(
         "/auth/me",
-        headers={"Authorization": f"Bearer {auth_token}"}
+        headers=auth_header
     )
     assert response.status_code == 200
     data = response.json()
     assert data["email"] == test_user.email
     assert data["is_paid"] == False
+
+
+def test_verify_password_cache():
+    """Test repeated password checks reuse the cached bcrypt result"""
+    from unittest.mock import patch
+    from app.routers.auth import hash_password, verify_password
+    
+    hashed = hash_password("cachedpass123")
+    assert verify_password("cachedpass123", hashed) == True
+    assert verify_password("wrongpass", hashed) == False
+    
+    # Both results are now cached - bcrypt should not run again
+    with patch('app.routers.auth.bcrypt.checkpw') as mock_verify:
+        assert verify_password("cachedpass123", hashed) == True
+        assert verify_password("wrongpass", hashed) == False
+        mock_verify.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_login_rate_limit(client):
+    """Test login is rate limited to 10 requests per minute per IP"""
+    from app.utils.limiter import limiter
+    
+    limiter.reset()
+    login_data = {"email": "nobody@example.com", "password": "wrongpass"}
+    try:
+        for i in range(10):
+            response = await client.post("/auth/login", json=login_data)
+            assert response.status_code == 401
+        
+        # 11th request within the window is rejected
+        response = await client.post("/auth/login", json=login_data)
+        assert response.status_code == 429
+        assert response.json()["detail"] == "Too many login attempts. Please try again later."
+    finally:
+        limiter.reset()
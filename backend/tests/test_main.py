@@ -0,0 +1,34 @@
+import pytest
+from app.main import RealIPMiddleware
+
+
+@pytest.mark.asyncio
+async def test_health_security_headers(client):
+    """Test security headers are added to responses"""
+    response = await client.get("/health")
+    assert response.status_code == 200
+    assert response.headers["X-Content-Type-Options"] == "nosniff"
+    assert response.headers["X-Frame-Options"] == "DENY"
+    assert response.headers["Referrer-Policy"] == "strict-origin-when-cross-origin"
+
+
+@pytest.mark.asyncio
+async def test_real_ip_middleware():
+    """Test client address is taken from the last X-Forwarded-For hop"""
+    seen = {}
+    
+    async def app(scope, receive, send):
+        seen["client"] = scope["client"]
+    
+    scope = {
+        "type": "http",
+        "client": ("172.18.0.5", 51234),
+        "headers": [(b"x-forwarded-for", b"10.0.0.1, 203.0.113.7")]
+    }
+    await RealIPMiddleware(app)(scope, None, None)
+    assert seen["client"] == ("203.0.113.7", 0)
+    
+    # Without the header the proxy address is kept
+    scope = {"type": "http", "client": ("172.18.0.5", 51234), "headers": []}
+    await RealIPMiddleware(app)(scope, None, None)
+    assert seen["client"] == ("172.18.0.5", 51234)
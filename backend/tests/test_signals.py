@@ -1,47 +1,61 @@
+import asyncio
 import pytest
+import pytest_asyncio
+from datetime import date
+from app.routers import signals
 
 
-def test_signals_free_user(client, auth_token):
+@pytest_asyncio.fixture
+async def signal_limit_key(test_user):
+    """Daily signal counter key for the free test user, cleared around each test"""
+    key = f"signal_limit:{test_user.id}:{date.today().isoformat()}"
+    await signals._redis.delete(key)
+    yield key
+    await signals._redis.delete(key)
+
+
+@pytest.mark.parametrize("n,expected_status", [(1, 200), (2, 200), (3, 200), (4, 403)])
+@pytest.mark.asyncio
+async def test_signals_free_user(client, auth_header, signal_limit_key, n, expected_status):
     """Test signals endpoint for free user - verify rate limit enforced"""
     
-    # First 3 requests should succeed
-    for i in range(3):
-        response = client.get(
-            "/signals",
-            headers={"Authorization": f"Bearer {auth_token}"}
-        )
-        assert response.status_code == 200
+    # Prime the daily counter with the previous n-1 requests
+    for _ in range(n - 1):
+        await signals._LIMIT_SCRIPT(keys=[signal_limit_key], args=[86400])
+    
+    # First 3 requests succeed with limited signals, 4th fails with 403
+    response = await client.get(
+        "/signals",
+        headers=auth_header
+    )
+    assert response.status_code == expected_status
+    if expected_status == 200:
         data = response.json()
         assert data["is_paid"] == False
         assert len(data["signals"]) == 3  # Free users get limited signals
         assert "3/day" in data["user_limit"]
-    
-    # 4th request should fail with 403
-    response = client.get(
-        "/signals",
-        headers={"Authorization": f"Bearer {auth_token}"}
-    )
-    assert response.status_code == 403
-    assert "Daily limit exceeded" in response.json()["detail"]
+    else:
+        assert "Daily limit exceeded" in response.json()["detail"]
 
 
-def test_signals_paid_user(client, paid_auth_token):
+@pytest.mark.asyncio
+async def test_signals_paid_user(client, paid_auth_header):
     """Test signals endpoint for paid user - verify unlimited access"""
     
-    # Paid users should get unlimited signals
-    for i in range(10):  # Test multiple requests
-        response = client.get(
-            "/signals",
-            headers={"Authorization": f"Bearer {paid_auth_token}"}
-        )
-        assert response.status_code == 200
-        data = response.json()
-        assert data["is_paid"] == True
-        assert len(data["signals"]) > 3  # Paid users get all signals
-        assert data["user_limit"] is None
+    # Paid users should get unlimited signals (10 concurrent requests)
+    responses = await asyncio.gather(*(
+        client.get("/signals", headers=paid_auth_header)
+        for _ in range(10)
+    ))
+    assert all(response.status_code == 200 for response in responses)
+    data = responses[0].json()
+    assert data["is_paid"] == True
+    assert len(data["signals"]) > 3  # Paid users get all signals
+    assert data["user_limit"] is None
 
 
-def test_signals_without_auth(client):
+@pytest.mark.asyncio
+async def test_signals_without_auth(client):
     """Test signals endpoint without authentication"""
-    response = client.get("/signals")
+    response = await client.get("/signals")
     assert response.status_code == 403  # No authorization header